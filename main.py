@@ -1,15 +1,116 @@
+import logging
 import os
+import orjson
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import List, Optional
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from bson import ObjectId
+from bson.errors import InvalidId
+from cachetools import TTLCache
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from datetime import datetime, timedelta
 
-from database import db, create_document, get_documents
+from database import connect_db, close_db, create_document, create_documents, get_documents
 from schemas import Movie, Cinema, Screen, Showtime, Booking
 
-app = FastAPI(title="ShowTime API")
+logger = logging.getLogger(__name__)
+
+def _json_default(o):
+    if isinstance(o, ObjectId):
+        return str(o)
+    raise TypeError
+
+def _dumps(content) -> bytes:
+    return orjson.dumps(content, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+class MongoJSONResponse(ORJSONResponse):
+    """orjson response that also serializes ObjectId, so raw Mongo documents can be returned."""
+
+    def render(self, content) -> bytes:
+        return _dumps(content)
+
+# Documents encoded per chunk written to the client
+STREAM_BATCH_SIZE = 500
+
+def _wants_ndjson(request: Request) -> bool:
+    return "application/x-ndjson" in request.headers.get("accept", "")
+
+def empty_documents(request: Request) -> Response:
+    """Empty list response, negotiated the same way as stream_documents."""
+    if _wants_ndjson(request):
+        return Response(b"", media_type="application/x-ndjson")
+    return MongoJSONResponse([])
+
+async def stream_documents(cursor, request: Request) -> StreamingResponse:
+    """Stream documents as the cursor yields them instead of buffering the whole list.
+
+    Sends NDJSON when the client asks for application/x-ndjson, otherwise a JSON array.
+    The first batch is fetched before the response starts, so query errors still
+    surface as a normal error response rather than a truncated 200. Each batch is
+    written as one chunk.
+    """
+    first = await cursor.to_list(STREAM_BATCH_SIZE)
+
+    if _wants_ndjson(request):
+        async def ndjson():
+            try:
+                batch = first
+                while batch:
+                    yield b"".join(_dumps(doc) + b"\n" for doc in batch)
+                    batch = await cursor.to_list(STREAM_BATCH_SIZE)
+            finally:
+                await cursor.close()
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    async def json_array():
+        try:
+            if not first:
+                yield b"[]"
+                return
+            yield b"[" + b",".join(_dumps(doc) for doc in first)
+            while True:
+                batch = await cursor.to_list(STREAM_BATCH_SIZE)
+                if not batch:
+                    break
+                yield b"," + b",".join(_dumps(doc) for doc in batch)
+            yield b"]"
+        finally:
+            await cursor.close()
+    return StreamingResponse(json_array(), media_type="application/json")
+
+async def create_indexes(db):
+    """Index every field the endpoints filter on.
+
+    Failures are logged rather than raised so the app still boots (and /test can
+    report the problem) when Mongo is unreachable.
+    """
+    try:
+        await db["showtime"].create_index([("movie_id", 1), ("start_time", 1)])
+        await db["showtime"].create_index([("cinema_id", 1), ("start_time", 1)])
+        await db["showtime"].create_index("start_time")
+        await db["booking"].create_index("showtime_id")
+        await db["cinema"].create_index("city")
+        await db["screen"].create_index("cinema_id")
+    except PyMongoError:
+        logger.exception("Index creation failed")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One client (and connection pool) per worker process, tied to its event loop
+    app.state.db = connect_db()
+    if app.state.db is not None:
+        await create_indexes(app.state.db)
+    yield
+    close_db()
+
+def get_db(request: Request):
+    return request.app.state.db
+
+app = FastAPI(title="ShowTime API", default_response_class=MongoJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,13 +122,77 @@ app.add_middleware(
 
 # Helpers
 
-def to_str_id(doc):
-    if not doc:
-        return doc
-    doc["_id"] = str(doc["_id"]) if "_id" in doc else None
+# Screens have at most 20 rows (see schemas.Screen)
+ROW_LABELS = [chr(ord('A') + i) for i in range(20)]
+
+MOVIE_LIST_FIELDS = {
+    "title": 1, "poster_url": 1, "rating": 1, "genres": 1,
+    "languages": 1, "runtime_mins": 1, "certification": 1,
+}
+
+@lru_cache(maxsize=8192)
+def _parse_oid(s: str) -> ObjectId:
+    return ObjectId(s)
+
+def _oid(s: str) -> ObjectId:
+    """Parse a hex id string, reusing the ObjectId for ids seen recently."""
+    try:
+        return _parse_oid(s)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid id")
+
+# Movies, screens and the cinemas-by-city map rarely change; keep recently read ones for a few minutes
+_reference_cache = TTLCache(maxsize=1024, ttl=300)
+
+async def _find_reference(db, collection: str, oid: ObjectId, projection: dict = None):
+    key = (collection, oid)
+    doc = _reference_cache.get(key)
+    if doc is None:
+        doc = await db[collection].find_one({"_id": oid}, projection)
+        if doc:
+            _reference_cache[key] = doc
     return doc
 
+async def get_movie_cached(db, movie_id: ObjectId):
+    return await _find_reference(db, "movie", movie_id, {"created_at": 0, "updated_at": 0})
+
+async def get_screen_cached(db, screen_id: ObjectId):
+    return await _find_reference(db, "screen", screen_id, {"rows": 1, "seats_per_row": 1})
+
+CITY_CINEMAS_CACHE_KEY = ("cinema", "by_city")
+
+async def get_city_cinema_ids(db, city: str) -> List[ObjectId]:
+    """Cinema ids in a city; drop CITY_CINEMAS_CACHE_KEY after writing cinemas."""
+    by_city = _reference_cache.get(CITY_CINEMAS_CACHE_KEY)
+    if by_city is None:
+        by_city = {}
+        async for c in db["cinema"].find({}, {"city": 1}):
+            by_city.setdefault(c.get("city"), []).append(c["_id"])
+        # Don't cache a miss, so an empty database doesn't hide cinemas added later
+        if by_city:
+            _reference_cache[CITY_CINEMAS_CACHE_KEY] = by_city
+    return by_city.get(city, [])
+
+async def reserve_seats(db, showtime_id: ObjectId, seats: List[str]) -> bool:
+    """Atomically claim seats in the per-showtime seat_lock document.
+
+    Returns False if any of the seats is already taken.
+    """
+    q = {"_id": showtime_id, "booked": {"$nin": seats}}
+    update = {"$addToSet": {"booked": {"$each": seats}}}
+    try:
+        await db["seat_lock"].update_one(q, update, upsert=True)
+        return True
+    except DuplicateKeyError:
+        # The lock document exists but the filter did not match (seat taken),
+        # or a concurrent first booking created it; retry without upsert.
+        result = await db["seat_lock"].update_one(q, update)
+        return result.matched_count > 0
+
 # Seed data route for demo
+PRICE_MAP = {"Silver": 200.0, "Gold": 350.0, "Platinum": 500.0}
+SEED_SHOW_HOURS = [12, 15, 18, 21]
+
 class SeedResponse(BaseModel):
     movies: int
     cinemas: int
@@ -35,15 +200,15 @@ class SeedResponse(BaseModel):
     showtimes: int
 
 @app.post("/seed", response_model=SeedResponse)
-def seed():
+async def seed(db=Depends(get_db)):
     """Seed a minimal dataset for demo usage."""
     # Avoid duplicate seed: if movies exist, skip
-    if db["movie"].count_documents({}) > 0:
+    if await db["movie"].estimated_document_count() > 0:
         return SeedResponse(
-            movies=db["movie"].count_documents({}),
-            cinemas=db["cinema"].count_documents({}),
-            screens=db["screen"].count_documents({}),
-            showtimes=db["showtime"].count_documents({}),
+            movies=await db["movie"].estimated_document_count(),
+            cinemas=await db["cinema"].estimated_document_count(),
+            screens=await db["screen"].estimated_document_count(),
+            showtimes=await db["showtime"].estimated_document_count(),
         )
 
     # Movies
@@ -68,115 +233,132 @@ def seed():
         synopsis="Two strangers connect through music and chance encounters.",
     )
 
-    m1_id = create_document("movie", m1)
-    m2_id = create_document("movie", m2)
+    m1_id, m2_id = await create_documents(db, "movie", [m1, m2])
 
     # Cinemas
-    c1_id = create_document("cinema", {"name": "Downtown Multiplex", "city": "Mumbai", "address": "MG Road"})
-    c2_id = create_document("cinema", {"name": "Skyline Cinemas", "city": "Mumbai", "address": "Bandra West"})
+    c1_id, c2_id = await create_documents(db, "cinema", [
+        Cinema(name="Downtown Multiplex", city="Mumbai", address="MG Road"),
+        Cinema(name="Skyline Cinemas", city="Mumbai", address="Bandra West"),
+    ])
+    _reference_cache.pop(CITY_CINEMAS_CACHE_KEY, None)
 
     # Screens
-    s1_id = create_document("screen", {"cinema_id": c1_id, "name": "Screen 1", "rows": 8, "seats_per_row": 12})
-    s2_id = create_document("screen", {"cinema_id": c1_id, "name": "Screen 2", "rows": 10, "seats_per_row": 12})
-    s3_id = create_document("screen", {"cinema_id": c2_id, "name": "Prime Screen", "rows": 9, "seats_per_row": 14})
+    s1_id, s2_id, s3_id = await create_documents(db, "screen", [
+        Screen(cinema_id=c1_id, name="Screen 1", rows=8, seats_per_row=12),
+        Screen(cinema_id=c1_id, name="Screen 2", rows=10, seats_per_row=12),
+        Screen(cinema_id=c2_id, name="Prime Screen", rows=9, seats_per_row=14),
+    ])
 
     # Showtimes for next 3 days
-    base = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
-    times = [base + timedelta(hours=h) for h in [12, 15, 18, 21]]
-    price_map = {"Silver": 200.0, "Gold": 350.0, "Platinum": 500.0}
-
-    for show_day in range(3):
-        day = base + timedelta(days=show_day)
-        for t in times:
-            start = datetime(day.year, day.month, day.day, t.hour, 0, 0).isoformat()
-            create_document("showtime", {
-                "movie_id": m1_id,
-                "cinema_id": c1_id,
-                "screen_id": s1_id,
-                "start_time": start,
-                "language": "English",
-                "price_map": price_map
-            })
-            create_document("showtime", {
-                "movie_id": m2_id,
-                "cinema_id": c2_id,
-                "screen_id": s3_id,
-                "start_time": start,
-                "language": "English",
-                "price_map": price_map
-            })
+    base = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    all_starts = [base + timedelta(days=d, hours=h) for d in range(3) for h in SEED_SHOW_HOURS]
+
+    showtimes = [
+        Showtime(
+            movie_id=movie_id,
+            cinema_id=cinema_id,
+            screen_id=screen_id,
+            start_time=start,
+            language="English",
+            price_map=PRICE_MAP,
+        )
+        for start in all_starts
+        for movie_id, cinema_id, screen_id in [(m1_id, c1_id, s1_id), (m2_id, c2_id, s3_id)]
+    ]
+    await create_documents(db, "showtime", showtimes)
 
     return SeedResponse(
-        movies=db["movie"].count_documents({}),
-        cinemas=db["cinema"].count_documents({}),
-        screens=db["screen"].count_documents({}),
-        showtimes=db["showtime"].count_documents({}),
+        movies=await db["movie"].estimated_document_count(),
+        cinemas=await db["cinema"].estimated_document_count(),
+        screens=await db["screen"].estimated_document_count(),
+        showtimes=await db["showtime"].estimated_document_count(),
     )
 
 @app.get("/")
-def root():
+async def root():
     return {"message": "ShowTime API running"}
 
 @app.get("/movies")
-def list_movies():
-    docs = get_documents("movie")
-    return [to_str_id(d) for d in docs]
+async def list_movies(request: Request, db=Depends(get_db)):
+    return await stream_documents(db["movie"].find({}, MOVIE_LIST_FIELDS), request)
 
 @app.get("/movies/{movie_id}")
-def get_movie(movie_id: str):
-    doc = db["movie"].find_one({"_id": ObjectId(movie_id)})
+async def get_movie(movie_id: str, db=Depends(get_db)):
+    doc = await get_movie_cached(db, _oid(movie_id))
     if not doc:
         raise HTTPException(status_code=404, detail="Movie not found")
-    return to_str_id(doc)
+    return MongoJSONResponse(doc)
 
 @app.get("/cinemas")
-def list_cinemas(city: Optional[str] = None):
+async def list_cinemas(city: Optional[str] = None, db=Depends(get_db)):
     q = {"city": city} if city else {}
-    docs = get_documents("cinema", q)
-    return [to_str_id(d) for d in docs]
+    docs = await get_documents(db, "cinema", q)
+    return MongoJSONResponse(docs)
 
 @app.get("/showtimes")
-def list_showtimes(movie_id: Optional[str] = None, city: Optional[str] = None, date: Optional[str] = None):
+async def list_showtimes(
+    request: Request,
+    movie_id: Optional[str] = None,
+    city: Optional[str] = None,
+    date: Optional[str] = None,
+    db=Depends(get_db),
+):
     q = {}
     if movie_id:
-        q["movie_id"] = movie_id
-    if city:
-        cinema_ids = [str(c["_id"]) for c in db["cinema"].find({"city": city}, {"_id": 1})]
-        q["cinema_id"] = {"$in": cinema_ids} if cinema_ids else "__none__"
+        q["movie_id"] = _oid(movie_id)
     if date:
-        # Filter by date prefix of ISO string
-        q["start_time"] = {"$regex": f"^{date}"}
-    docs = get_documents("showtime", q)
-    # Attach movie and cinema names
-    for d in docs:
+        # Range over the whole day (YYYY-MM-DD only) so a start_time index can be used
         try:
-            movie = db["movie"].find_one({"_id": ObjectId(d["movie_id"])}, {"title": 1})
-            cinema = db["cinema"].find_one({"_id": ObjectId(d["cinema_id"])}, {"name": 1})
-            d["movie_title"] = movie.get("title") if movie else None
-            d["cinema_name"] = cinema.get("name") if cinema else None
-        except Exception:
-            pass
-    return [to_str_id(d) for d in docs]
+            day = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date")
+        q["start_time"] = {"$gte": day, "$lt": day + timedelta(days=1)}
+    if city:
+        cinema_ids = await get_city_cinema_ids(db, city)
+        if not cinema_ids:
+            return empty_documents(request)
+        q["cinema_id"] = {"$in": cinema_ids}
+    # Attach movie and cinema names server-side in a single round-trip
+    pipeline = [
+        {"$match": q},
+        {"$lookup": {
+            "from": "cinema", "localField": "cinema_id", "foreignField": "_id",
+            "pipeline": [{"$project": {"name": 1}}], "as": "c",
+        }},
+        {"$lookup": {
+            "from": "movie", "localField": "movie_id", "foreignField": "_id",
+            "pipeline": [{"$project": {"title": 1}}], "as": "m",
+        }},
+        {"$addFields": {
+            "movie_title": {"$first": "$m.title"},
+            "cinema_name": {"$first": "$c.name"},
+        }},
+        {"$project": {
+            "m": 0, "c": 0, "created_at": 0, "updated_at": 0,
+        }},
+    ]
+    return await stream_documents(db["showtime"].aggregate(pipeline), request)
 
 @app.get("/seats/{showtime_id}")
-def get_seats(showtime_id: str):
-    st = db["showtime"].find_one({"_id": ObjectId(showtime_id)})
+async def get_seats(showtime_id: str, db=Depends(get_db)):
+    st_id = _oid(showtime_id)
+    st = await db["showtime"].find_one({"_id": st_id}, {"screen_id": 1, "price_map": 1})
     if not st:
         raise HTTPException(status_code=404, detail="Showtime not found")
-    screen = db["screen"].find_one({"_id": ObjectId(st["screen_id"])})
+    screen = await get_screen_cached(db, st["screen_id"])
     rows = screen.get("rows", 8)
     seats_per_row = screen.get("seats_per_row", 12)
 
-    # Booked seats
-    booked_docs = db["booking"].find({"showtime_id": showtime_id}, {"seats": 1})
-    booked = set()
-    for b in booked_docs:
-        for s in b.get("seats", []):
-            booked.add(s)
+    # Booked seats, unioned server-side into a single document
+    result = await db["booking"].aggregate([
+        {"$match": {"showtime_id": st_id}},
+        {"$unwind": "$seats"},
+        {"$group": {"_id": None, "s": {"$addToSet": "$seats"}}},
+    ]).to_list(None)
+    booked = set(result[0]["s"]) if result else set()
 
     grid = []
-    for r in range(rows):
-        row_label = chr(ord('A') + r)
+    for row_label in ROW_LABELS[:rows]:
         row = []
         for c in range(1, seats_per_row + 1):
             code = f"{row_label}{c}"
@@ -192,15 +374,17 @@ class BookingRequest(BaseModel):
     seats: List[str]
 
 @app.post("/book")
-def book_seats(req: BookingRequest):
+async def book_seats(req: BookingRequest, db=Depends(get_db)):
     # Validate showtime
-    st = db["showtime"].find_one({"_id": ObjectId(req.showtime_id)})
+    st_id = _oid(req.showtime_id)
+    st = await db["showtime"].find_one({"_id": st_id}, {"price_map": 1})
     if not st:
         raise HTTPException(status_code=404, detail="Showtime not found")
 
-    # Check availability atomically-ish
-    existing = list(db["booking"].find({"showtime_id": req.showtime_id, "seats": {"$in": req.seats}}))
-    if existing:
+    # Fast-path check against existing bookings, then claim the seats atomically
+    if await db["booking"].count_documents({"showtime_id": st_id, "seats": {"$in": req.seats}}, limit=1):
+        raise HTTPException(status_code=409, detail="Some seats are already booked")
+    if not await reserve_seats(db, st_id, req.seats):
         raise HTTPException(status_code=409, detail="Some seats are already booked")
 
     # Calculate total using base price (Platinum if closer to center else Gold/Silver)
@@ -208,20 +392,23 @@ def book_seats(req: BookingRequest):
     total = base_price * len(req.seats)
 
     booking = Booking(
-        showtime_id=req.showtime_id,
+        showtime_id=st_id,
         customer_name=req.customer_name,
         customer_email=req.customer_email,
         seats=req.seats,
         total_amount=float(total)
     )
-    booking_id = create_document("booking", booking)
+    try:
+        booking_id = await create_document(db, "booking", booking)
+    except Exception:
+        await db["seat_lock"].update_one({"_id": st_id}, {"$pullAll": {"booked": req.seats}})
+        raise
     return {"booking_id": booking_id, "total": total}
 
 @app.get("/test")
-def test_database():
-    from database import db as _db
+async def test_database(db=Depends(get_db)):
     try:
-        collections = _db.list_collection_names()
+        collections = await db.list_collection_names()
         return {"backend": "running", "database": "connected", "collections": collections}
     except Exception as e:
         return {"backend": "running", "database": f"error: {str(e)}"}
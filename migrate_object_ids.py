@@ -0,0 +1,62 @@
+"""
+One-off migration: convert string foreign keys to ObjectIds and string
+showtime start times to BSON dates
+
+Documents written before references were stored as ObjectIds hold them as
+24-char hex strings, and older showtimes hold start_time as an ISO string,
+which never matches the date range used by /showtimes?date=. Run once
+against an existing database:
+
+    python migrate_object_ids.py
+
+Values that cannot be converted are left as-is and reported so they can be
+fixed by hand.
+"""
+import asyncio
+
+from database import connect_db, close_db
+
+FOREIGN_KEYS = {
+    "screen": ["cinema_id"],
+    "showtime": ["movie_id", "cinema_id", "screen_id"],
+    "booking": ["showtime_id"],
+}
+
+HEX_OBJECT_ID = "^[0-9a-fA-F]{24}$"
+
+async def migrate_foreign_keys(db):
+    for collection, fields in FOREIGN_KEYS.items():
+        for field in fields:
+            result = await db[collection].update_many(
+                {field: {"$type": "string", "$regex": HEX_OBJECT_ID}},
+                [{"$set": {field: {"$toObjectId": f"${field}"}}}],
+            )
+            print(f"{collection}.{field}: converted {result.modified_count}")
+            malformed = await db[collection].count_documents({field: {"$type": "string"}})
+            if malformed:
+                print(f"{collection}.{field}: {malformed} documents with malformed ids left unconverted")
+
+async def migrate_start_times(db):
+    result = await db["showtime"].update_many(
+        {"start_time": {"$type": "string"}},
+        [{"$set": {"start_time": {
+            "$dateFromString": {"dateString": "$start_time", "onError": "$start_time"},
+        }}}],
+    )
+    print(f"showtime.start_time: converted {result.modified_count}")
+    malformed = await db["showtime"].count_documents({"start_time": {"$type": "string"}})
+    if malformed:
+        print(f"showtime.start_time: {malformed} documents with unparseable dates left unconverted")
+
+async def main():
+    db = connect_db()
+    if db is None:
+        raise SystemExit("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+    try:
+        await migrate_foreign_keys(db)
+        await migrate_start_times(db)
+    finally:
+        close_db()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,8 +4,24 @@ Database Schemas for BookMyShow-style app
 Each Pydantic model corresponds to a MongoDB collection. The collection name is the
 lowercase of the class name (e.g., Movie -> "movie").
 """
-from typing import List, Optional
-from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Annotated, List, Optional
+from bson import ObjectId
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
+
+def _to_object_id(v):
+    if isinstance(v, str):
+        if not ObjectId.is_valid(v):
+            raise ValueError("Invalid ObjectId")
+        return ObjectId(v)
+    return v
+
+# Foreign keys are stored as BSON ObjectIds; hex strings are accepted on input
+PyObjectId = Annotated[ObjectId, BeforeValidator(_to_object_id)]
+
+class MongoModel(BaseModel):
+    """Base for models holding PyObjectId references."""
+    model_config = ConfigDict(arbitrary_types_allowed=True)
 
 class Movie(BaseModel):
     title: str = Field(..., description="Movie title")
@@ -22,22 +38,22 @@ class Cinema(BaseModel):
     city: str = Field(..., description="City name")
     address: Optional[str] = Field(None, description="Street address")
 
-class Screen(BaseModel):
-    cinema_id: str = Field(..., description="Reference to cinema _id as string")
+class Screen(MongoModel):
+    cinema_id: PyObjectId = Field(..., description="Reference to cinema _id")
     name: str = Field(..., description="Screen name e.g., Screen 1")
     rows: int = Field(..., ge=1, le=20, description="Number of seat rows")
     seats_per_row: int = Field(..., ge=1, le=30, description="Seats per row")
 
-class Showtime(BaseModel):
-    movie_id: str = Field(..., description="Reference to movie _id as string")
-    cinema_id: str = Field(..., description="Reference to cinema _id as string")
-    screen_id: str = Field(..., description="Reference to screen _id as string")
-    start_time: str = Field(..., description="ISO datetime string for show start")
+class Showtime(MongoModel):
+    movie_id: PyObjectId = Field(..., description="Reference to movie _id")
+    cinema_id: PyObjectId = Field(..., description="Reference to cinema _id")
+    screen_id: PyObjectId = Field(..., description="Reference to screen _id")
+    start_time: datetime = Field(..., description="Show start as a BSON date")
     language: str = Field(..., description="Language of the show")
     price_map: dict = Field(default_factory=dict, description="Seat category to price mapping")
 
-class Booking(BaseModel):
-    showtime_id: str = Field(..., description="Reference to showtime _id as string")
+class Booking(MongoModel):
+    showtime_id: PyObjectId = Field(..., description="Reference to showtime _id")
     customer_name: str = Field(..., description="Name of customer")
     customer_email: str = Field(..., description="Email of customer")
     seats: List[str] = Field(..., description="List of seat codes e.g., A1, A2")